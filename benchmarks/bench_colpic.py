@@ -0,0 +1,58 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import gzip
+import sys
+
+from PIL import Image
+
+from common import BACKGROUND, CONTENTS, SIZES, bench, fixturePath
+
+from klipmi.utils import parseThumbnail
+from klipmi.utils.libcolpic import ColPicEncode, blendRGB565
+
+
+def main() -> int:
+    mismatches = 0
+    for content in CONTENTS:
+        for size in SIZES:
+            name = "%s_%d" % (content, size)
+            img = Image.open(fixturePath(name + ".png"))
+            img.load()
+            with gzip.open(fixturePath(name + ".colpic.gz"), "rt") as f:
+                golden = f.read()
+
+            # parseThumbnail resizes in place, so every run gets a copy
+            if parseThumbnail(img.copy(), size, size, BACKGROUND) != golden:
+                print("%s: output differs from the golden encode" % name)
+                mismatches += 1
+
+            bench(
+                "parseThumbnail %s" % name,
+                lambda: parseThumbnail(img.copy(), size, size, BACKGROUND),
+            )
+            color16 = blendRGB565(img, (0x4D, 0x4D, 0x4D))
+            bench(
+                "ColPicEncode %s" % name,
+                lambda: ColPicEncode(color16, size, size, size * size * 10, 1024),
+            )
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import json
+
+from common import benchAsync, fixturePath
+
+from nextion.constants import IO_TIMEOUT
+
+from klipmi.model.config import KlipmiConfig
+from klipmi.model.display import COMMAND_END, Display
+from klipmi.model.state import KlipmiState
+from klipmi.model.status import PrinterStatus
+from klipmi.ui.openq1.openq1 import OpenQ1UI
+from klipmi.ui.openq1.pages import MainPage
+
+FILENAME = "benchy.gcode"
+
+
+async def ignoreEvent(type, data):
+    pass
+
+
+class FakeDisplay(Display):
+    """Acks every command at once and only counts what was written"""
+
+    def __init__(self):
+        super().__init__(
+            KlipmiConfig({"device": "/dev/null", "baudrate": 115200, "ui": "openq1"}),
+            ignoreEvent,
+        )
+        self.encoding = "utf-8"
+        # Awake, as after connect, so nothing gets deferred
+        self._sleeping = False
+        self.frames = 0
+        self.commands = 0
+        self.bytes = 0
+
+    def _write_command_raw(self, command: bytes):
+        self.frames += 1
+        self.commands += command.count(COMMAND_END) + 1
+        self.bytes += len(command) + len(COMMAND_END)
+
+    def _flush_read_buffer(self):
+        pass
+
+    async def _read_packet(self, timeout=IO_TIMEOUT) -> bytes:
+        return b"\x01"
+
+
+def main():
+    with open(fixturePath("deltas.json")) as f:
+        deltas = [delta for delta, _ in json.load(f)]
+
+    status = PrinterStatus(OpenQ1UI.statusObjects)
+    status.update(
+        {
+            "extruder": {"temperature": 25.0, "target": 220.0},
+            "heater_bed": {"temperature": 25.0, "target": 60.0},
+            "heater_generic chamber": {"temperature": 25.0, "target": 0.0},
+            "output_pin caselight": {"value": 1.0},
+            "output_pin sound": {"value": 0.0},
+            "print_stats": {"filename": FILENAME, "state": "printing"},
+        }
+    )
+
+    state = KlipmiState()
+    state.display = FakeDisplay()
+    page = MainPage(state, lambda page: None)
+    # The thumbnail is already on screen
+    page.filename = FILENAME
+    page.pictureLoaded = True
+
+    display = state.display
+    renders = 0
+
+    async def fullRender():
+        nonlocal renders
+        renders += 1
+        display.resetShadow()
+        await page.onPrinterStatusUpdate(status, None)
+
+    async def replay():
+        display.frames = display.commands = display.bytes = 0
+        for delta in deltas:
+            await page.onPrinterStatusUpdate(status, status.update(delta))
+
+    benchAsync("MainPage full render", fullRender, 1000)
+    print(
+        "  %.1f frames, %.1f commands, %d bytes per full render"
+        % (
+            display.frames / renders,
+            display.commands / renders,
+            display.bytes / renders,
+        )
+    )
+
+    benchAsync("MainPage render, %d deltas" % len(deltas), replay, 1)
+    print(
+        "  %d frames, %d commands, %d bytes per replay"
+        % (display.frames, display.commands, display.bytes)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import statistics
+import time
+
+from common import fixturePath
+from tjcsim import TJCSimulator
+
+from nextion import EventType
+
+from klipmi.model.config import KlipmiConfig
+from klipmi.model.display import Display, Priority
+from klipmi.model.state import KlipmiState
+from klipmi.model.status import PrinterStatus
+from klipmi.ui.openq1.openq1 import OpenQ1UI
+from klipmi.ui.openq1.pages import MainPage, MovePage
+
+FILENAME = "benchy.gcode"
+TAPS = 20
+
+
+def throughput(simulator: TJCSimulator, name: str, since: float, elapsed: float):
+    commands = sum(1 for t, _ in simulator.received if t >= since)
+    print(
+        "%-44s %9.0f commands/s  (%d in %.2fs)"
+        % (name, commands / elapsed, commands, elapsed)
+    )
+
+
+async def run(baud: int, delay: float):
+    simulator = TJCSimulator(baud, delay)
+    await simulator.start()
+    loop = asyncio.get_running_loop()
+
+    state = KlipmiState()
+
+    async def onEvent(type: EventType, data):
+        # What a nav bar tap does: change page ahead of everything else
+        if type == EventType.TOUCH:
+            with state.display.priority(Priority.INTERACTIVE):
+                await state.display.command("page %d" % MovePage.id)
+
+    state.display = Display(
+        KlipmiConfig({"device": simulator.path, "baudrate": baud, "ui": "openq1"}),
+        onEvent,
+    )
+    await state.display.connect()
+    page = MainPage(state, lambda page: None)
+    page.filename = FILENAME
+    page.pictureLoaded = True
+
+    with open(fixturePath("deltas.json")) as f:
+        deltas = [delta for delta, _ in json.load(f)]
+    with gzip.open(fixturePath("photo_160.colpic.gz"), "rt") as f:
+        thumbnail = f.read()
+
+    status = PrinterStatus(OpenQ1UI.statusObjects)
+    status.update(
+        {
+            "extruder": {"temperature": 25.0, "target": 220.0},
+            "heater_bed": {"temperature": 25.0, "target": 60.0},
+            "heater_generic chamber": {"temperature": 25.0, "target": 0.0},
+            "output_pin caselight": {"value": 1.0},
+            "output_pin sound": {"value": 0.0},
+            "print_stats": {"filename": FILENAME, "state": "printing"},
+        }
+    )
+
+    since, start = loop.time(), time.monotonic()
+    for delta in deltas:
+        await page.onPrinterStatusUpdate(status, status.update(delta))
+    throughput(
+        simulator,
+        "MainPage render, %d deltas" % len(deltas),
+        since,
+        time.monotonic() - start,
+    )
+
+    since, start = loop.time(), time.monotonic()
+    await page.uploadThumbnail("cp0", thumbnail)
+    throughput(
+        simulator,
+        "Thumbnail upload, %d chars" % len(thumbnail),
+        since,
+        time.monotonic() - start,
+    )
+
+    # Taps in the middle of an upload, from the touch event leaving the
+    # display to the page change arriving there
+    latency = []
+    upload = asyncio.create_task(page.uploadThumbnail("cp0", thumbnail * 4))
+    for _ in range(TAPS):
+        await asyncio.sleep(0.05)
+        arrived = simulator.waitFor(lambda command: command.startswith("page "))
+        tapped = loop.time()
+        simulator.touch(31)
+        latency.append(await arrived - tapped)
+    await upload
+    print(
+        "%-44s %12.1f ms median  %.1f ms max"
+        % (
+            "Tap during upload, %d taps" % TAPS,
+            statistics.median(latency) * 1000,
+            max(latency) * 1000,
+        )
+    )
+
+    await state.display.disconnect()
+    await simulator.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="klipmi against a simulated TJC")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument(
+        "--delay", type=float, default=0.001, help="processing time per command"
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.baud, args.delay))
+
+
+if __name__ == "__main__":
+    main()
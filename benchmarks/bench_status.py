@@ -0,0 +1,75 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import copy
+import json
+
+from common import bench, fixturePath
+
+from klipmi.model.status import PrinterStatus
+from klipmi.utils import updateNestedDict
+
+
+def main():
+    with open(fixturePath("deltas.json")) as f:
+        deltas = [delta for delta, _ in json.load(f)]
+
+    objects = {}
+    for delta in deltas:
+        for name, fields in delta.items():
+            objects.setdefault(name, {}).update(dict.fromkeys(fields))
+
+    # Every variant keeps its state between runs, each run replays the
+    # same sequence of changes on top of it
+    nested: dict = {}
+    tracked: dict = {}
+    layout = {name: list(fields) for name, fields in objects.items()}
+    store = PrinterStatus(layout)
+
+    def replayDict():
+        for delta in deltas:
+            updateNestedDict(nested, delta)
+
+    def replayTracked():
+        # A plain dict that reports changed paths like PrinterStatus does
+        for delta in deltas:
+            changed = set()
+            for name, fields in delta.items():
+                current = tracked.setdefault(name, {})
+                for field, value in fields.items():
+                    if isinstance(value, dict):
+                        value = updateNestedDict(
+                            copy.deepcopy(current.get(field, {})), value
+                        )
+                    if current.get(field) != value:
+                        current[field] = value
+                        changed.add((name, field))
+
+    def replayStore():
+        for delta in deltas:
+            store.update(delta)
+
+    print("%d recorded deltas per run" % len(deltas))
+    bench("updateNestedDict replay", replayDict)
+    bench("dict merge with changed paths replay", replayTracked)
+    bench("PrinterStatus.update replay", replayStore)
+    bench("PrinterStatus layout build", lambda: PrinterStatus(layout))
+
+
+if __name__ == "__main__":
+    main()
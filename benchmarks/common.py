@@ -0,0 +1,68 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import asyncio
+import os
+import sys
+import time
+import timeit
+
+from typing import Callable, Coroutine
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(BENCH_DIR, "fixtures")
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "src"))
+
+# Thumbnail fixtures, (content, size)
+CONTENTS = ["flat", "gradient", "photo"]
+SIZES = [96, 160, 300]
+BACKGROUND = "4d4d4d"
+
+REPEAT = 5
+
+
+def fixturePath(name: str) -> str:
+    return os.path.join(FIXTURE_DIR, name)
+
+
+def report(name: str, seconds: float, number: int):
+    print("%-44s %12.3f ms  (%d runs)" % (name, seconds / number * 1000, number))
+
+
+def bench(name: str, fn: Callable, number: int | None = None) -> float:
+    """Time fn, best of REPEAT rounds, and return seconds per call"""
+    timer = timeit.Timer(fn)
+    if number is None:
+        number = timer.autorange()[0]
+    best = min(timer.repeat(REPEAT, number))
+    report(name, best, number)
+    return best / number
+
+
+def benchAsync(name: str, fn: Callable[[], Coroutine], number: int) -> float:
+    """Time number awaits of fn inside one event loop, best of REPEAT rounds"""
+
+    async def run() -> float:
+        start = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        return time.perf_counter() - start
+
+    best = min(asyncio.run(run()) for _ in range(REPEAT))
+    report(name, best, number)
+    return best / number
@@ -0,0 +1,124 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import gzip
+import json
+import math
+import sys
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from common import BACKGROUND, CONTENTS, SIZES, fixturePath
+
+from klipmi.utils import parseThumbnail
+
+DELTA_COUNT = 600
+# Moonraker batches status updates every 250ms
+DELTA_INTERVAL = 0.25
+
+
+def flat(size: int) -> Image.Image:
+    # A single colored part on a transparent plate, like most slicer previews
+    img = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    s = size / 10
+    draw.polygon(
+        [(2 * s, 8 * s), (5 * s, 1.5 * s), (8 * s, 8 * s), (5 * s, 6.5 * s)],
+        fill=(231, 120, 38, 255),
+    )
+    draw.rectangle([3 * s, 8.3 * s, 7 * s, 8.9 * s], fill=(200, 104, 33, 255))
+    return img
+
+
+def gradient(size: int) -> Image.Image:
+    y, x = np.mgrid[0:size, 0:size] / (size - 1)
+    rgb = np.stack([x * 255, y * 255, (1 - x) * (1 - y) * 255], axis=-1)
+    return Image.fromarray(rgb.astype(np.uint8), "RGB").convert("RGBA")
+
+
+def photo(size: int) -> Image.Image:
+    # Smooth shading with sensor-like noise under a feathered round mask
+    rng = np.random.default_rng(size)
+    base = Image.fromarray(rng.integers(0, 256, (6, 6, 3), dtype=np.uint8), "RGB")
+    rgb = np.asarray(base.resize((size, size), Image.Resampling.BICUBIC), float)
+    rgb = np.clip(rgb + rng.normal(0, 12, rgb.shape), 0, 255)
+
+    y, x = np.mgrid[0:size, 0:size]
+    r = np.hypot(x - size / 2, y - size / 2) / (size / 2)
+    alpha = np.clip((1 - r) * 8, 0, 1) * 255
+    rgba = np.dstack([rgb, alpha]).astype(np.uint8)
+    return Image.fromarray(rgba, "RGBA")
+
+
+def deltas() -> list:
+    """
+    notify_status_update params for a print, in the shape Moonraker sends
+    them: only the fields that changed since the previous update.
+    """
+    rng = np.random.default_rng(0)
+    result = []
+    position = [110.0, 110.0, 0.2, 1000.0]
+    for i in range(DELTA_COUNT):
+        t = i * DELTA_INTERVAL
+        delta: dict = {
+            "extruder": {"temperature": round(220 + rng.normal(0, 0.4), 2)},
+            "motion_report": {
+                "live_position": position[:],
+                "live_velocity": round(abs(rng.normal(150, 40)), 3),
+                "live_extruder_velocity": round(abs(rng.normal(6, 2)), 3),
+            },
+            "print_stats": {"print_duration": t, "total_duration": t + 12},
+        }
+        position[0] = round(110 + 60 * math.cos(t), 3)
+        position[1] = round(110 + 60 * math.sin(t), 3)
+        position[3] = round(position[3] + rng.uniform(0, 8), 3)
+
+        if i % 2 == 0:
+            delta["heater_bed"] = {"temperature": round(60 + rng.normal(0, 0.1), 2)}
+        if i % 4 == 0:
+            delta["heater_generic chamber"] = {
+                "temperature": round(38 + rng.normal(0, 0.2), 2)
+            }
+            delta["fan"] = {"speed": round(rng.uniform(0.8, 1), 3)}
+        if i % 40 == 0:
+            position[2] = round(position[2] + 0.2, 3)
+            delta["print_stats"]["info"] = {"current_layer": i // 40 + 1}
+            delta["display_status"] = {"progress": round(i / DELTA_COUNT, 4)}
+        result.append([delta, 1000 + t])
+    return result
+
+
+def main():
+    writeGoldens = "--goldens" in sys.argv
+    for content in CONTENTS:
+        for size in SIZES:
+            name = "%s_%d" % (content, size)
+            img = globals()[content](size)
+            img.save(fixturePath(name + ".png"), optimize=True)
+            if writeGoldens:
+                encoded = parseThumbnail(img, size, size, BACKGROUND)
+                with gzip.open(fixturePath(name + ".colpic.gz"), "wt") as f:
+                    f.write(encoded)
+
+    with open(fixturePath("deltas.json"), "w") as f:
+        json.dump(deltas(), f, separators=(",", ":"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import struct
+import sys
+import tty
+
+from collections import deque
+from typing import Callable, Deque, Dict, List, TextIO, Tuple
+
+COMMAND_END = b"\xff\xff\xff"
+# Sent by the client to leave protocol reparse mode, never answered
+REPARSE_EXIT = b"DRAKJHSUYDGBNCJHGJKSHBDN"
+DEVICE_INFO = "comok 1,30614-0,TJC4827X243_011,52,61488,D264B8204F0E1828,16777216"
+
+# Return codes
+INVALID_INSTRUCTION = 0x00
+SUCCESS = 0x01
+INVALID_VARIABLE = 0x1A
+BUFFER_OVERFLOW = 0x24
+TOUCH_EVENT = 0x65
+PAGE_NUMBER = 0x66
+STRING_DATA = 0x70
+NUMBER_DATA = 0x71
+
+ASSIGNMENT = re.compile(r"^([\w.\[\]]+)=(.*)$")
+
+
+class TJCSimulator:
+    """
+    Emulates a TJC display on a pseudo-terminal. Commands take the serial
+    time of their bytes at the configured baud rate plus a fixed processing
+    delay each, and are handled one at a time like on the display's MCU.
+    """
+
+    def __init__(
+        self,
+        baud: int = 115200,
+        delay: float = 0.001,
+        buffer: int = 1024,
+        log: TextIO | None = None,
+    ):
+        self.baud: int = baud
+        self.delay: float = delay
+        # Size of the display's serial input buffer
+        self.buffer: int = buffer
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.path: str = os.ttyname(self.slave)
+
+        self.bkcmd: int = 2
+        self.page: int = 0
+        self.variables: Dict[str, int | str] = {"sleep": 0}
+        # (time processed, command) of everything received
+        self.received: List[Tuple[float, str]] = []
+        self.waiters: List[Tuple[Callable[[str], bool], asyncio.Future]] = []
+        self.overflows: int = 0
+        self.log: TextIO | None = log
+
+        self.data: bytes = b""
+        # Commands with the time they are done being processed, None for
+        # one that overflowed the input buffer
+        self.queue: asyncio.Queue[Tuple[float, bytes | None]] = asyncio.Queue()
+        # (start, size) of the commands still waiting in the input buffer
+        self.waiting: Deque[Tuple[float, int]] = deque()
+        # When the wire into the display, the MCU and the wire out are free
+        self.rxFree: float = 0
+        self.busyUntil: float = 0
+        self.txFree: float = 0
+        self.task: asyncio.Task | None = None
+
+    def wireTime(self, size: int) -> float:
+        # 10 bits go over the wire for every 8N1 character
+        return size * 10 / self.baud
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.master, self.__read)
+        self.task = asyncio.create_task(self.__process())
+
+    async def stop(self):
+        asyncio.get_running_loop().remove_reader(self.master)
+        if self.task is not None:
+            self.task.cancel()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def __read(self):
+        loop = asyncio.get_running_loop()
+        try:
+            self.data += os.read(self.master, 4096)
+        except OSError:
+            return
+
+        while COMMAND_END in self.data:
+            frame, _, self.data = self.data.partition(COMMAND_END)
+            size = len(frame) + len(COMMAND_END)
+            # The frame is complete once its last byte is over the wire
+            arrived = max(self.rxFree, loop.time()) + self.wireTime(size)
+            self.rxFree = arrived
+            while len(self.waiting) > 0 and self.waiting[0][0] <= arrived:
+                self.waiting.popleft()
+
+            buffered = sum(waiting for _, waiting in self.waiting)
+            if buffered > 0 and buffered + size > self.buffer:
+                # Dropped, answered in order with the other replies
+                self.overflows += 1
+                self.queue.put_nowait((arrived, None))
+                continue
+
+            start = max(arrived, self.busyUntil)
+            self.busyUntil = start + self.delay
+            self.waiting.append((start, size))
+            self.queue.put_nowait((self.busyUntil, frame))
+
+    async def __process(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            done, frame = await self.queue.get()
+            await asyncio.sleep(max(0, done - loop.time()))
+            if frame is None:
+                self.reply(bytes([BUFFER_OVERFLOW]))
+            else:
+                self.__handle(frame.lstrip(b"\xff"))
+
+    def __handle(self, frame: bytes):
+        if frame == REPARSE_EXIT:
+            return
+
+        now = asyncio.get_running_loop().time()
+        command = frame.decode("utf-8", "replace")
+        self.received.append((now, command))
+        if self.log is not None:
+            self.log.write("%.6f\t%s\n" % (now, command))
+        for waiter in list(self.waiters):
+            match, future = waiter
+            if match(command):
+                self.waiters.remove(waiter)
+                if not future.done():
+                    future.set_result(now)
+
+        if command == "connect":
+            self.reply(DEVICE_INFO.encode())
+        elif command == "sendme":
+            self.reply(bytes([PAGE_NUMBER, self.page]))
+        elif command.startswith("get "):
+            self.__get(command[4:].strip())
+        elif command.startswith("page "):
+            if command[5:].strip().isdigit():
+                self.page = int(command[5:])
+            self.ack(SUCCESS)
+        elif (assignment := ASSIGNMENT.match(command)) is not None:
+            self.__assign(*assignment.groups())
+        elif command.split(" ")[0].isidentifier() or "." in command:
+            # vis, ref, xstr, cp0.write(...) and the like
+            self.ack(SUCCESS)
+        else:
+            self.ack(INVALID_INSTRUCTION)
+
+    def __get(self, name: str):
+        if name == "dp":
+            value = self.page
+        elif name in self.variables:
+            value = self.variables[name]
+        else:
+            # Components that were never set read as 0
+            value = 0 if "." in name else None
+
+        if value is None:
+            self.ack(INVALID_VARIABLE)
+        elif isinstance(value, str):
+            self.reply(bytes([STRING_DATA]) + value.encode())
+        else:
+            self.reply(bytes([NUMBER_DATA]) + struct.pack("<i", value))
+
+    def __assign(self, name: str, value: str):
+        if value.startswith('"') and value.endswith('"') and len(value) >= 2:
+            self.variables[name] = value[1:-1]
+        else:
+            try:
+                self.variables[name] = int(value)
+            except ValueError:
+                self.ack(INVALID_VARIABLE)
+                return
+
+        if name == "bkcmd":
+            self.bkcmd = self.variables[name]
+        elif name == "dp":
+            self.page = self.variables[name]
+        self.ack(SUCCESS)
+
+    def ack(self, code: int):
+        # bkcmd 1 answers successes, 2 failures and 3 both
+        if (code == SUCCESS and self.bkcmd in (1, 3)) or (
+            code != SUCCESS and self.bkcmd in (2, 3)
+        ):
+            self.reply(bytes([code]))
+
+    def reply(self, data: bytes):
+        loop = asyncio.get_running_loop()
+        data += COMMAND_END
+        self.txFree = max(self.txFree, loop.time()) + self.wireTime(len(data))
+        loop.call_at(self.txFree, os.write, self.master, data)
+
+    def touch(self, component: int, page: int | None = None, pressed: bool = True):
+        """Send a touch event, by default for the current page"""
+        page = self.page if page is None else page
+        self.reply(bytes([TOUCH_EVENT, page, component, int(pressed)]))
+
+    def waitFor(self, match: Callable[[str], bool]) -> asyncio.Future:
+        """Future resolving to the time the next command matching arrives"""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((match, future))
+        return future
+
+    def commandsPerSecond(self, since: float = 0) -> float:
+        times = [t for t, _ in self.received if t >= since]
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def stats(self) -> str:
+        return "page %d, %d commands, %.0f commands/s, %d overflows" % (
+            self.page,
+            len(self.received),
+            self.commandsPerSecond(),
+            self.overflows,
+        )
+
+
+async def console(simulator: TJCSimulator):
+    """Reads "touch <component> [page]" and "stats" lines from stdin"""
+    loop = asyncio.get_running_loop()
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if line == "":
+            return
+        args = line.split()
+        if len(args) == 0:
+            continue
+
+        try:
+            if args[0] == "touch":
+                page = int(args[2]) if len(args) > 2 else None
+                simulator.touch(int(args[1]), page)
+            elif args[0] == "stats":
+                print(simulator.stats())
+            else:
+                print("unknown command: %s" % args[0])
+        except (IndexError, ValueError):
+            print("usage: touch <component> [page] | stats")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="TJC display simulator")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument(
+        "--delay", type=float, default=0.001, help="processing time per command"
+    )
+    parser.add_argument(
+        "--buffer", type=int, default=1024, help="serial input buffer size"
+    )
+    parser.add_argument(
+        "--log", type=argparse.FileType("a"), help="append received commands here"
+    )
+    args = parser.parse_args()
+
+    simulator = TJCSimulator(args.baud, args.delay, args.buffer, args.log)
+    await simulator.start()
+    print('Listening, set device = "%s" in klipmi.toml' % simulator.path)
+    try:
+        await console(simulator)
+    finally:
+        print(simulator.stats())
+        await simulator.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -23,14 +23,30 @@ import tomllib
 from optparse import OptionParser
 
 CONFIG_PATH = "printer_data/config/klipmi.toml"
+CACHE_PATH = "printer_data/cache/klipmi"
 TABLE_KLIPMI = "klipmi"
 TABLE_MOONRAKER = "moonraker"
+TABLE_THUMBNAILS = "thumbnails"
+TABLE_METRICS = "metrics"
 KEY_DEVICE = "device"
 KEY_BAUD = "baudrate"
 KEY_UI = "ui"
+KEY_UPLOAD_WINDOW = "upload-window"
+KEY_MAX_FPS = "max-fps"
 KEY_HOST = "host"
 KEY_PORT = "port"
 KEY_API = "api-key"
+KEY_CACHE_DIR = "cache-dir"
+KEY_CACHE_SIZE = "cache-size"
+KEY_MEMORY_ENTRIES = "memory-entries"
+KEY_WORKERS = "workers"
+KEY_EXECUTOR = "executor"
+KEY_WARM = "warm"
+KEY_WARM_WORKERS = "warm-workers"
+KEY_ENABLED = "enabled"
+KEY_BIND = "bind"
+KEY_FILE = "file"
+KEY_INTERVAL = "interval"
 
 
 def getCommaSeparatedArgs(option, _, value, parser):
@@ -62,6 +78,8 @@ class KlipmiConfig:
     device: str = ""
     baud: int = 115200
     ui: str = ""
+    upload_window: int = 2
+    max_fps: float = 10
 
     def __init__(self, config: dict):
         try:
@@ -79,6 +97,18 @@ class KlipmiConfig:
         except Exception as e:
             logging.exception(e)
 
+        try:
+            self.upload_window = config[KEY_UPLOAD_WINDOW]
+        except Exception as e:
+            logging.info(
+                "upload-window not set in config, defaulting to %d" % self.upload_window
+            )
+
+        try:
+            self.max_fps = config[KEY_MAX_FPS]
+        except Exception as e:
+            logging.info("max-fps not set in config, defaulting to %g" % self.max_fps)
+
 
 class MoonrakerConfig:
     host: str = "0.0.0.0"
@@ -102,6 +132,97 @@ class MoonrakerConfig:
             logging.exception(e)
 
 
+class ThumbnailConfig:
+    cache_dir: str = os.path.expanduser("~") + "/" + CACHE_PATH + "/thumbnails"
+    cache_size: int = 16 * 1024 * 1024
+    memory_entries: int = 8
+    workers: int = 1
+    executor: str = "process"
+    warm: bool = True
+    warm_workers: int = 1
+
+    def __init__(self, config: dict):
+        try:
+            self.cache_dir = os.path.expanduser(config[KEY_CACHE_DIR])
+        except Exception as e:
+            logging.info(
+                "cache-dir not set in config, defaulting to %s" % self.cache_dir
+            )
+
+        try:
+            self.cache_size = config[KEY_CACHE_SIZE]
+        except Exception as e:
+            logging.info(
+                "cache-size not set in config, defaulting to %d" % self.cache_size
+            )
+
+        try:
+            self.memory_entries = config[KEY_MEMORY_ENTRIES]
+        except Exception as e:
+            logging.info(
+                "memory-entries not set in config, defaulting to %d"
+                % self.memory_entries
+            )
+
+        try:
+            self.workers = config[KEY_WORKERS]
+        except Exception as e:
+            logging.info("workers not set in config, defaulting to %d" % self.workers)
+
+        try:
+            self.executor = config[KEY_EXECUTOR]
+        except Exception as e:
+            logging.info("executor not set in config, defaulting to %s" % self.executor)
+
+        try:
+            self.warm = config[KEY_WARM]
+        except Exception as e:
+            logging.info("warm not set in config, defaulting to %s" % self.warm)
+
+        try:
+            self.warm_workers = config[KEY_WARM_WORKERS]
+        except Exception as e:
+            logging.info(
+                "warm-workers not set in config, defaulting to %d" % self.warm_workers
+            )
+
+
+class MetricsConfig:
+    enabled: bool = False
+    bind: str = "127.0.0.1"
+    # Prometheus endpoint, 0 to not serve one
+    port: int = 9464
+    # File rewritten every interval seconds, empty to not write one
+    file: str = ""
+    interval: float = 15
+
+    def __init__(self, config: dict):
+        try:
+            self.enabled = config[KEY_ENABLED]
+        except Exception as e:
+            logging.info("enabled not set in config, defaulting to %s" % self.enabled)
+
+        try:
+            self.bind = config[KEY_BIND]
+        except Exception as e:
+            logging.info("bind not set in config, defaulting to %s" % self.bind)
+
+        try:
+            self.port = config[KEY_PORT]
+        except Exception as e:
+            logging.info("port not set in config, defaulting to %d" % self.port)
+
+        try:
+            self.file = os.path.expanduser(config[KEY_FILE])
+        except Exception as e:
+            logging.info("file not set in config, defaulting to none")
+
+        try:
+            self.interval = config[KEY_INTERVAL]
+        except Exception as e:
+            logging.info("interval not set in config, defaulting to %s" % self.interval)
+
+
 class Config:
     timeout: int = 5
 
@@ -110,6 +231,10 @@ class Config:
         self._raw: dict = self.parse()
         self.klipmi: KlipmiConfig = KlipmiConfig(self._raw[TABLE_KLIPMI])
         self.moonraker: MoonrakerConfig = MoonrakerConfig(self._raw[TABLE_MOONRAKER])
+        self.thumbnails: ThumbnailConfig = ThumbnailConfig(
+            self._raw.get(TABLE_THUMBNAILS, {})
+        )
+        self.metrics: MetricsConfig = MetricsConfig(self._raw.get(TABLE_METRICS, {}))
 
     def parse(self) -> dict:
         with open(self.path, "rb") as f:
@@ -0,0 +1,138 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+
+from moonraker_api import MoonrakerClient
+from typing import Any, Dict, Set, Tuple
+
+from klipmi.utils import Histogram, metrics
+
+
+class RequestDispatcher:
+    """
+    Runs Moonraker RPCs as tracked requests. At most `concurrency` of them
+    are in flight, each one is bounded by a timeout, failures of fire and
+    forget requests are logged and latencies are kept per method. Express
+    requests skip the queue, requests in a lane only queue behind that
+    lane's own limit.
+    """
+
+    def __init__(
+        self,
+        client: MoonrakerClient,
+        concurrency: int,
+        timeout: float,
+        lanes: Dict[str, int] | None = None,
+    ):
+        self.client: MoonrakerClient = client
+        self.timeout: float = timeout
+        self.slots: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+        self.lanes: Dict[str, asyncio.Semaphore] = {
+            name: asyncio.Semaphore(limit) for name, limit in (lanes or {}).items()
+        }
+        self.ids = itertools.count()
+        # id -> (method, time it was queued)
+        self.pending: Dict[int, Tuple[str, float]] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self.latency: Dict[str, Histogram] = {}
+        self.pendingGauge = metrics.gauge(
+            "klipmi_rpc_pending", "Moonraker requests queued or in flight"
+        )
+        metrics.onCollect(lambda: self.pendingGauge.set(len(self.pending)))
+
+    async def call(
+        self,
+        method: str,
+        params: Dict[str, Any] | None = None,
+        timeout: float | None = -1,
+        express: bool = False,
+        lane: str | None = None,
+    ) -> Any:
+        """
+        Call method and return its result. A timeout of -1 uses the default,
+        None waits as long as it takes.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+
+        id = next(self.ids)
+        self.pending[id] = (method, time.monotonic())
+        try:
+            if express:
+                return await self.__send(method, params or {}, timeout)
+            async with self.slots if lane is None else self.lanes[lane]:
+                return await self.__send(method, params or {}, timeout)
+        finally:
+            del self.pending[id]
+
+    def submit(
+        self,
+        method: str,
+        params: Dict[str, Any] | None = None,
+        timeout: float | None = -1,
+        express: bool = False,
+        lane: str | None = None,
+    ) -> asyncio.Task:
+        if timeout == -1:
+            timeout = self.timeout
+        task = asyncio.create_task(
+            self.__logged(method, params, timeout, express, lane)
+        )
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def cancelAll(self):
+        for task in list(self.tasks):
+            task.cancel()
+
+    async def __send(self, method: str, params: Dict[str, Any], timeout):
+        start = time.monotonic()
+        try:
+            return await asyncio.wait_for(
+                self.client.call_method(method, **params), timeout
+            )
+        finally:
+            elapsed = time.monotonic() - start
+            if method not in self.latency:
+                self.latency[method] = Histogram()
+                metrics.register(
+                    "klipmi_rpc_seconds",
+                    self.latency[method],
+                    "Moonraker request round trip time",
+                    method=method,
+                )
+            self.latency[method].observe(elapsed)
+            if timeout is not None and timeout / 2 < elapsed < timeout:
+                logging.warning(
+                    "%s took %.2fs (%s)" % (method, elapsed, self.latency[method])
+                )
+
+    async def __logged(self, method: str, params, timeout, express: bool, lane):
+        try:
+            return await self.call(method, params, timeout, express, lane)
+        except asyncio.TimeoutError:
+            logging.error("%s got no response within %ss" % (method, timeout))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error("%s failed: %s" % (method, e))
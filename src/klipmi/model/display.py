@@ -0,0 +1,286 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+
+from collections import deque
+from contextvars import ContextVar
+from enum import IntEnum
+from nextion import TJC, CommandFailed, CommandTimeout
+from nextion.constants import IO_TIMEOUT
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Tuple
+
+from klipmi.model.config import KlipmiConfig
+from klipmi.utils import PriorityLock, metrics
+
+# Serial time each bulk write command should take, and the bounds on the
+# resulting number of characters per command
+UPLOAD_CHUNK_TIME = 0.05
+UPLOAD_CHUNK_MIN = 128
+UPLOAD_CHUNK_MAX = 1024
+# Terminator after every command, the last one is added by the protocol
+COMMAND_END = b"\xff\xff\xff"
+# How long to wait for each reply still owed after a command failed
+DRAIN_TIMEOUT = 0.2
+
+
+class Priority(IntEnum):
+    # Page changes and touch feedback
+    INTERACTIVE = 0
+    # Status renders
+    STATUS = 1
+    # Thumbnail uploads and other large transfers
+    BULK = 2
+
+
+# Priority of the display traffic of the current task
+commandPriority: ContextVar[Priority] = ContextVar(
+    "commandPriority", default=Priority.STATUS
+)
+
+
+def formatValue(value) -> str:
+    # Same formatting as TJC.set
+    if isinstance(value, (str, float)):
+        return '"%s"' % value
+    elif isinstance(value, int):
+        return str(value)
+    raise TypeError('value type "%s" is not supported for set' % type(value).__name__)
+
+
+class DisplayBatch:
+    """
+    Commands collected inside Display.batch(), sent as one serial write once
+    the block is left.
+    """
+
+    def __init__(self, shadow: Dict[str, Any]):
+        self.shadow: Dict[str, Any] = shadow
+        # (command, key, value), key and value only for sets
+        self.commands: List[Tuple[str, str | None, Any]] = []
+
+    def set(self, key: str, value):
+        if "." in key and key in self.shadow and self.shadow[key] == value:
+            return
+        self.commands.append(("%s=%s" % (key, formatValue(value)), key, value))
+
+    def command(self, command: str):
+        self.commands.append((command, None, None))
+
+
+class Display(TJC):
+    def __init__(self, options: KlipmiConfig, eventHandler: Callable):
+        super().__init__(options.device, options.baud, eventHandler)
+        self.options: KlipmiConfig = options
+        # Last value written to each component attribute on the current page
+        self.shadow: Dict[str, Any] = {}
+        # Taken before the command lock, so the most urgent traffic goes first
+        self.gate: PriorityLock = PriorityLock()
+
+        self.commandsSent = metrics.counter(
+            "klipmi_serial_commands_total", "Commands written to the display"
+        )
+        self.bytesSent = metrics.counter(
+            "klipmi_serial_bytes_total", "Bytes written to the display"
+        )
+        self.ackTime = metrics.histogram(
+            "klipmi_serial_ack_seconds", "Time from writing a command to its ack"
+        )
+        self.queueGauges = {
+            p: metrics.gauge(
+                "klipmi_display_queue_depth",
+                "Tasks waiting for the display",
+                priority=p.name.lower(),
+            )
+            for p in Priority
+        }
+        metrics.onCollect(self.__collect)
+
+    def __collect(self):
+        for priority, gauge in self.queueGauges.items():
+            gauge.set(self.gate.depth[priority])
+
+    @property
+    def queueDepth(self) -> Dict[str, int]:
+        return {p.name: self.gate.depth[p] for p in Priority}
+
+    @staticmethod
+    @contextlib.contextmanager
+    def priority(priority: Priority) -> Iterator[None]:
+        token = commandPriority.set(priority)
+        try:
+            yield
+        finally:
+            commandPriority.reset(token)
+
+    @contextlib.asynccontextmanager
+    async def __turn(self) -> AsyncIterator[None]:
+        await self.gate.acquire(commandPriority.get())
+        try:
+            yield
+        finally:
+            self.gate.release()
+
+    @property
+    def chunkSize(self) -> int:
+        # 10 bits go over the wire for every 8N1 character
+        size = int(self.options.baud / 10 * UPLOAD_CHUNK_TIME)
+        return max(UPLOAD_CHUNK_MIN, min(UPLOAD_CHUNK_MAX, size))
+
+    def resetShadow(self):
+        self.shadow.clear()
+
+    async def set(self, key: str, value, *args, **kwargs):
+        # Only component attributes, device variables like sleep can change
+        # behind our back
+        if "." not in key:
+            return await super().set(key, value, *args, **kwargs)
+
+        if key in self.shadow and self.shadow[key] == value:
+            return True
+
+        self.shadow.pop(key, None)
+        result = await super().set(key, value, *args, **kwargs)
+        # None when TJC deferred the set until wakeup, it comes back through
+        # here then
+        if result is not None:
+            self.shadow[key] = value
+        return result
+
+    async def command(self, command: str, *args, **kwargs):
+        async with self.__turn():
+            start = time.monotonic()
+            result = await super().command(command, *args, **kwargs)
+            self.ackTime.observe(time.monotonic() - start)
+            return result
+
+    def _write_command_raw(self, command: bytes):
+        super()._write_command_raw(command)
+        self.commandsSent.inc(command.count(COMMAND_END) + 1)
+        self.bytesSent.inc(len(command) + len(COMMAND_END))
+
+    async def pipeline(self, commands: List[str], timeout=IO_TIMEOUT):
+        """
+        Send commands back to back, keeping up to upload-window of them
+        waiting for an ack instead of a full round trip for each one. The
+        link is handed over between commands whenever more urgent traffic
+        is waiting.
+        """
+        priority = commandPriority.get()
+        # (command, time it was written)
+        pending: Deque[Tuple[str, float]] = deque()
+        index = 0
+        while index < len(commands):
+            async with self.__turn(), self._command_lock:
+                self._flush_read_buffer()
+                try:
+                    while index < len(commands):
+                        if len(pending) > 0 and self.gate.contended(priority):
+                            logging.debug(
+                                "Yielding display, queued: %s" % self.queueDepth
+                            )
+                            break
+                        if len(pending) >= self.options.upload_window:
+                            await self.__waitAck(*pending[0], timeout)
+                            pending.popleft()
+                        self._write_command_raw(commands[index].encode(self.encoding))
+                        pending.append((commands[index], time.monotonic()))
+                        index += 1
+
+                    while pending:
+                        await self.__waitAck(*pending[0], timeout)
+                        pending.popleft()
+                except CommandFailed:
+                    # The failed command's reply is already read
+                    await self.__drain(len(pending) - 1)
+                    raise
+                except BaseException:
+                    await self.__drain(len(pending))
+                    raise
+
+    @contextlib.asynccontextmanager
+    async def batch(
+        self, acks: bool = True, timeout=IO_TIMEOUT
+    ) -> AsyncIterator[DisplayBatch]:
+        """
+        Collect sets and commands and write them back to back in one frame,
+        then wait for all of their acks together. Without acks the frame is
+        wrapped in bkcmd=0 and only the bkcmd=3 restoring them is waited on.
+        """
+        batch = DisplayBatch(self.shadow)
+        yield batch
+        if len(batch.commands) == 0:
+            return
+
+        if self.sleeping:
+            # Let TJC defer the sets until wakeup
+            for command, key, value in batch.commands:
+                if key is None:
+                    await self.command(command, timeout)
+                else:
+                    await self.set(key, value, timeout)
+            return
+
+        commands = [command for command, _, _ in batch.commands]
+        if not acks:
+            commands = ["bkcmd=0", *commands, "bkcmd=3"]
+
+        async with self.__turn(), self._command_lock:
+            for _, key, _ in batch.commands:
+                if key is not None:
+                    self.shadow.pop(key, None)
+            self._flush_read_buffer()
+            self._write_command_raw(
+                COMMAND_END.join(c.encode(self.encoding) for c in commands)
+            )
+            written = time.monotonic()
+            expected = commands if acks else commands[-1:]
+            for i, command in enumerate(expected):
+                try:
+                    await self.__waitAck(command, written, timeout)
+                except CommandFailed:
+                    await self.__drain(len(expected) - i - 1)
+                    raise
+                except BaseException:
+                    await self.__drain(len(expected) - i)
+                    raise
+            for _, key, value in batch.commands:
+                if key is not None and "." in key:
+                    self.shadow[key] = value
+
+    async def __waitAck(self, command: str, written: float, timeout):
+        try:
+            response = await self._read_packet(timeout=timeout)
+        except asyncio.TimeoutError:
+            raise CommandTimeout('Command "%s" response was not received' % command)
+        self.ackTime.observe(time.monotonic() - written)
+
+        if len(response) == 1 and response[0] != 0x01:
+            raise CommandFailed(command, response[0])
+
+    async def __drain(self, count: int):
+        # Read the replies still owed for commands that were already
+        # written, so the next command does not take one of them as its own
+        for _ in range(count):
+            try:
+                await self._read_packet(timeout=DRAIN_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                return
@@ -0,0 +1,92 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import asyncio
+import logging
+import os
+
+from aiohttp import web
+
+from klipmi.model.config import MetricsConfig
+from klipmi.utils import MetricsRegistry
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class MetricsExporter:
+    """
+    Serves the registry on a Prometheus endpoint and/or rewrites it to a
+    file periodically, as configured.
+    """
+
+    def __init__(self, options: MetricsConfig, registry: MetricsRegistry):
+        self.options: MetricsConfig = options
+        self.registry: MetricsRegistry = registry
+        self.runner: web.AppRunner | None = None
+        self.task: asyncio.Task | None = None
+
+    async def start(self):
+        if not self.options.enabled:
+            return
+
+        if not self.options.port and not self.options.file:
+            logging.warning(
+                "Metrics are enabled but neither a port nor a file is set, "
+                "they will not be exported"
+            )
+            return
+
+        if self.options.port:
+            app = web.Application()
+            app.router.add_get("/metrics", self.__serve)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            await web.TCPSite(self.runner, self.options.bind, self.options.port).start()
+            logging.info(
+                "Serving metrics on http://%s:%d/metrics"
+                % (self.options.bind, self.options.port)
+            )
+
+        if self.options.file:
+            self.task = asyncio.create_task(self.__writeLoop())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def __serve(self, _: web.Request) -> web.Response:
+        return web.Response(
+            body=self.registry.render(),
+            headers={"Content-Type": PROMETHEUS_CONTENT_TYPE},
+        )
+
+    async def __writeLoop(self):
+        while True:
+            await asyncio.to_thread(self.__write, self.registry.render())
+            await asyncio.sleep(self.options.interval)
+
+    def __write(self, text: str):
+        try:
+            with open(self.options.file + ".tmp", "w") as f:
+                f.write(text)
+            # Readers never see a half written file
+            os.replace(self.options.file + ".tmp", self.options.file)
+        except Exception as e:
+            logging.exception(e)
@@ -16,11 +16,10 @@ You should have received a copy of the GNU General Public License along with
 klipmi. If not, see <https://www.gnu.org/licenses/>. 
 """
 
-import requests
-import io
+import aiohttp
+import logging
 
 from enum import StrEnum
-from PIL import Image
 from moonraker_api import MoonrakerClient, MoonrakerListener
 from moonraker_api.websockets.websocketclient import (
     WEBSOCKET_STATE_CONNECTING,
@@ -34,7 +33,23 @@ from typing import Callable, Coroutine, Dict, List, Literal
 from urllib.request import pathname2url
 
 from klipmi.model.config import MoonrakerConfig
-from klipmi.utils import updateNestedDict
+from klipmi.model.dispatcher import RequestDispatcher
+from klipmi.model.status import PrinterStatus
+from klipmi.utils import ReconnectManager
+
+# Thumbnails and other file downloads share one keep-alive HTTP session
+HTTP_CONNECTIONS = 4
+HTTP_TIMEOUT = 5
+# RPCs in flight at once, and how long one may take unless it says otherwise
+RPC_CONCURRENCY = 4
+RPC_TIMEOUT = 10
+# Gcode scripts may run for as long as their moves take, they get a lane of
+# their own so they cannot hold the slots of everything else
+SCRIPT_LANE = "gcode"
+SCRIPT_CONCURRENCY = 2
+# Bounds in seconds of the backoff between reconnect attempts
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
 
 
 class PrinterState(StrEnum):
@@ -68,22 +83,49 @@ class Printer(MoonrakerListener):
         self.filesCallback: Callable = filesCallback
         self.options: MoonrakerConfig = options
         self.objects = objects
+        # Newest page change subscribe, a later one supersedes it
+        self.subscription: asyncio.Task | None = None
+        # Page changes during a resync leave the subscribe to it
+        self.resyncing: bool = False
         self.running: bool = False
-        self.status: dict = {}
+        self.status: PrinterStatus = PrinterStatus(objects)
         self.files: dict = {}
+        self.thumbnails: Dict[str, List[dict]] = {}
+        self.session: aiohttp.ClientSession | None = None
         self.client: MoonrakerClient = MoonrakerClient(
             self, options.host, options.port, options.api_key
         )
+        self.requests: RequestDispatcher = RequestDispatcher(
+            self.client,
+            RPC_CONCURRENCY,
+            RPC_TIMEOUT,
+            {SCRIPT_LANE: SCRIPT_CONCURRENCY},
+        )
+        self.reconnector: ReconnectManager = ReconnectManager(
+            self.client.connect, RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY
+        )
 
     async def connect(self) -> bool | None:
         self.running = True
         self.state = PrinterState.NOT_READY
-        return await self.client.connect()
+        try:
+            return await self.client.connect()
+        except Exception as e:
+            logging.warning("Failed to connect to Moonraker: %s" % e)
+            self.reconnector.start()
+            return False
 
     async def disconnect(self) -> None:
         self.running = False
+        self.reconnector.stop()
         await self.__updateState(PrinterState.STOPPED)
+        self.requests.cancelAll()
+        if self.subscription is not None:
+            self.subscription.cancel()
         await self.client.disconnect()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
 
     async def state_changed(self, state: str | Literal[120]):
         tasks: List[Coroutine] = []
@@ -91,12 +133,15 @@ class Printer(MoonrakerListener):
         if state == WEBSOCKET_STATE_CONNECTING:
             pass
         elif state == WEBSOCKET_STATE_CONNECTED:
-            tasks.append(self.__subscribe())
-            tasks.append(self.__updateKlippyStatus())
+            # The resync reports the state once Klippy's is known
+            asyncio.create_task(self.__resync())
+            return
         elif state == WEBSOCKET_STATE_STOPPING:
             pass
         elif state == WEBSOCKET_STATE_STOPPED:
             printerStatus = PrinterState.STOPPED
+            if self.running:
+                self.reconnector.start()
         elif state == WEBSOCKET_CONNECTION_TIMEOUT:
             printerStatus = PrinterState.MOONRAKER_ERR
 
@@ -106,105 +151,175 @@ class Printer(MoonrakerListener):
     async def on_notification(self, method: str, data: list):
         tasks: List[Coroutine] = []
         if method == Notifications.KLIPPY_READY:
-            tasks.append(self.__updatePrinterStatus())
-            tasks.append(self.__subscribe())
-            tasks.append(self.__updateKlippyStatus())
-            tasks.append(self.__updateState(PrinterState.READY))
+            tasks.append(self.__resync())
         elif method == Notifications.KLIPPY_SHUTDOWN:
             tasks.append(self.__updateState(PrinterState.KLIPPER_ERR))
         elif method == Notifications.KLIPPY_DISCONNECTED:
             tasks.append(self.__updateState(PrinterState.KLIPPER_ERR))
         elif method == Notifications.STATUS_UPDATE:
-            updateNestedDict(self.status, data[0])
-            tasks.append(self.printerCallback(self.status))
+            changed = self.status.update(data[0])
+            tasks.append(self.printerCallback(self.status, changed))
         elif method == Notifications.FILES_CHANGED:
             self.files = data[0]
+            for item in [self.files.get("item", {}), self.files.get("source_item", {})]:
+                self.thumbnails.pop(item.get("path"), None)
             tasks.append(self.filesCallback(self.files))
         asyncio.gather(*tasks)
 
     async def on_exception(self, exception: type | BaseException) -> None:
-        """TODO"""
+        # The connection drops to stopped right after, which reconnects
+        logging.warning("Moonraker connection error: %s" % exception)
+
+    def subscribe(self, objects: Dict[str, List[str]]):
+        # Moonraker replaces the previous subscription of this connection,
+        # pages that show the same objects keep it
+        if objects == self.objects:
+            return
+        self.objects = objects
+        if self.client.is_connected and not self.resyncing:
+            if self.subscription is not None:
+                self.subscription.cancel()
+            self.subscription = asyncio.create_task(self.__resubscribe())
+
+    async def __resubscribe(self):
+        try:
+            await self.__subscribe()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning("Failed to subscribe to printer objects: %s" % e)
 
     async def __subscribe(self):
-        await self.client.call_method("printer.objects.subscribe", objects=self.objects)
-
-    async def __updateKlippyStatus(self):
-        status = await self.client.get_klipper_status()
-        if status == "ready":
-            await self.__updatePrinterStatus()
-            await self.stateCallback(PrinterState.READY)
-        elif status == "shutdown" or status == "disconnected":
-            await self.stateCallback(PrinterState.KLIPPER_ERR)
-
-    async def __updatePrinterStatus(self):
-        self.status = (
-            await self.client.call_method("printer.objects.query", objects=self.objects)
-        )["status"]
+        response = await self.requests.call(
+            "printer.objects.subscribe", {"objects": self.objects}
+        )
+        if "status" in response:
+            # The response covers everything the page shows, draw it all
+            self.status.update(response["status"])
+            await self.printerCallback(self.status, None)
+
+    async def __resync(self):
+        """
+        Rebuild everything after a (re)connect in one sequenced round: Klippy
+        state and a subscribe that seeds the status, dropping stale thumbnails.
+        """
+        try:
+            self.resyncing = True
+            klippyState = await self.client.get_klipper_status()
+            if klippyState == "ready":
+                # The UI picks its page first, so one subscribe covers it
+                await self.__updateState(PrinterState.READY)
+                self.resyncing = False
+                await self.__subscribe()
+            elif klippyState == "shutdown" or klippyState == "disconnected":
+                await self.__updateState(PrinterState.KLIPPER_ERR)
+            else:
+                await self.__updateState(PrinterState.NOT_READY)
+
+            self.thumbnails.clear()
+        except Exception as e:
+            logging.warning("Failed to resync printer state: %s" % e)
+        finally:
+            self.resyncing = False
 
     async def __updateState(self, state: PrinterState):
         self.state = state
         await self.stateCallback(state)
 
+    def isPrinting(self) -> bool:
+        printStats = self.status.get("print_stats")
+        return printStats is not None and printStats.get("state") == "printing"
+
     async def getMetadata(self, filename):
-        metadata = await self.client.call_method(
-            "server.files.metadata", filename=filename
+        metadata = await self.requests.call(
+            "server.files.metadata", {"filename": filename}
         )
         return metadata
 
-    async def getThumbnail(self, size: int, filename: str):
-        thumbnailsList = await self.client.call_method(
-            "server.files.thumbnails", filename=filename
+    async def getThumbnails(self, filename: str) -> List[dict]:
+        if filename not in self.thumbnails:
+            thumbnails = await self.requests.call(
+                "server.files.thumbnails", {"filename": filename}
+            )
+            # Metadata may not be ready yet, so only keep a usable answer
+            if not isinstance(thumbnails, list) or len(thumbnails) == 0:
+                return []
+            self.thumbnails[filename] = thumbnails
+        return self.thumbnails[filename]
+
+    async def getThumbnail(self, size: int, filename: str) -> bytes:
+        thumbnails = sorted(
+            await self.getThumbnails(filename),
+            key=lambda item: max(item["width"], item["height"]),
         )
+        if len(thumbnails) == 0:
+            raise FileNotFoundError("No thumbnails in %s" % filename)
 
-        thumbnail = {}
-        for item in thumbnailsList:
-            if item["width"] == size:
+        # Smallest one that covers the target, or the largest there is
+        thumbnail = thumbnails[-1]
+        for item in thumbnails:
+            if max(item["width"], item["height"]) >= size:
                 thumbnail = item
                 break
-            if thumbnail == {} or item["width"] > item["width"]:
-                thumbnail = item
-
-        path = thumbnail["thumbnail_path"]
-        host = self.options.host
-        if "http" not in host:
-            host = "http://%s" % host
 
-        img = requests.get(
-            "%s/server/files/gcodes/%s" % (host, pathname2url(path)),
-            timeout=5,
+        return await self.fetch(
+            "/server/files/gcodes/%s" % pathname2url(thumbnail["thumbnail_path"])
         )
-        return Image.open(io.BytesIO(img.content))
+
+    def __httpSession(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            host = self.options.host
+            if "http" not in host:
+                host = "http://%s" % host
+
+            headers = {}
+            if self.options.api_key:
+                headers["X-Api-Key"] = self.options.api_key
+
+            self.session = aiohttp.ClientSession(
+                base_url=host,
+                headers=headers,
+                connector=aiohttp.TCPConnector(limit=HTTP_CONNECTIONS),
+            )
+        return self.session
+
+    async def fetch(self, path: str, timeout: float = HTTP_TIMEOUT) -> bytes:
+        async with self.__httpSession().get(
+            path, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            response.raise_for_status()
+            return await response.read()
 
     def runGcode(self, gcode: str):
-        asyncio.create_task(
-            self.client.call_method("printer.gcode.script", script=gcode)
+        # Scripts only return once every move in them is done
+        self.requests.submit(
+            "printer.gcode.script", {"script": gcode}, timeout=None, lane=SCRIPT_LANE
         )
 
     def emergencyStop(self):
-        asyncio.create_task(self.client.call_method("printer.emergency_stop"))
+        self.requests.submit("printer.emergency_stop", express=True)
 
     def restart(self):
-        asyncio.create_task(self.client.call_method("printer.restart"))
+        self.requests.submit("printer.restart")
 
     def firmwareRestart(self):
-        asyncio.create_task(self.client.call_method("printer.firmware_restart"))
+        self.requests.submit("printer.firmware_restart")
 
     def startPrint(self, filename: str):
-        asyncio.create_task(
-            self.client.call_method("printer.print.start", filename=filename)
-        )
+        self.requests.submit("printer.print.start", {"filename": filename})
 
     def pausePrint(self):
-        asyncio.create_task(self.client.call_method("printer.print.pause"))
+        self.requests.submit("printer.print.pause")
 
     def resumePrint(self):
-        asyncio.create_task(self.client.call_method("printer.print.resume"))
+        self.requests.submit("printer.print.resume")
 
     def cancelPrint(self):
-        asyncio.create_task(self.client.call_method("printer.print.cancel"))
+        self.requests.submit("printer.print.cancel")
 
     def togglePin(self, pin: str):
-        self.runGcode(
-            "SET_PIN PIN=%s VALUE=%d"
-            % (pin, 1 - self.status["output_pin %s" % pin]["value"])
-        )
+        value = self.status.get("output_pin %s" % pin)
+        if value is None or value.value is None:
+            logging.warning("State of pin %s is not known yet" % pin)
+            return
+        self.runGcode("SET_PIN PIN=%s VALUE=%d" % (pin, 1 - value.value))
@@ -0,0 +1,147 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+from typing import Dict, Iterable, List, Tuple
+
+from klipmi.utils import StatusPaths
+
+
+def mergeValue(current, value: dict) -> dict:
+    """
+    Merge a partial dict field into its current value. Only the merged
+    levels are copied, the current value is left as it was.
+    """
+    if not isinstance(current, dict):
+        return value
+    merged = dict(current)
+    for key, item in value.items():
+        merged[key] = mergeValue(current.get(key), item) if type(item) is dict else item
+    return merged
+
+
+def compileApply(name: str, fields: Tuple[str, ...]):
+    """
+    Generate the _apply method of an object, with a setter unrolled for
+    each field. It returns False as soon as the delta has a field outside
+    the layout.
+    """
+    lines = [
+        "def _apply(self, fields, changed, dict=dict, mergeValue=mergeValue):",
+        "    for field, value in fields.items():",
+    ]
+    for i, field in enumerate(fields):
+        lines += [
+            "        %s field == %r:" % ("if" if i == 0 else "elif", field),
+            "            current = self.%s" % field,
+            "            if value.__class__ is dict:",
+            "                value = mergeValue(current, value)",
+            "            if value != current:",
+            "                self.%s = value" % field,
+            "                changed.add(%r)" % ((name, field),),
+        ]
+    lines += ["        else:", "            return False", "    return True"]
+
+    namespace: dict = {}
+    exec("\n".join(lines), {"mergeValue": mergeValue}, namespace)
+    return namespace["_apply"]
+
+
+class StatusObject:
+    """
+    Fields of one printer object. Subclasses are generated with a slot per
+    field, and both obj.field and obj["field"] work. Fields not received
+    yet are None.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, field: str):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field)
+
+    def __contains__(self, field: str) -> bool:
+        return hasattr(self, field)
+
+    def get(self, field: str, default=None):
+        value = getattr(self, field, None)
+        return default if value is None else value
+
+    def __repr__(self) -> str:
+        values = {f: getattr(self, f) for f in self.__slots__}
+        return "%s(%s)" % (type(self).__name__, values)
+
+
+class PrinterStatus:
+    """
+    Printer status generated from the objects and fields the UI subscribes
+    to. Deltas from Moonraker are applied in place by setters generated
+    for each object's fields.
+    """
+
+    def __init__(self, objects: Dict[str, List[str]]):
+        self.objects: Dict[str, StatusObject] = {}
+        for name, fields in objects.items():
+            self.__build(name, fields)
+
+    def __build(self, name: str, fields: Iterable[str]):
+        old = self.objects.get(name)
+        slots = tuple(dict.fromkeys(fields))
+        cls = type(
+            "".join(part.title() for part in name.replace("_", " ").split()),
+            (StatusObject,),
+            {"__slots__": slots, "_apply": compileApply(name, slots)},
+        )
+        obj = cls()
+        for field in slots:
+            setattr(obj, field, None)
+        self.objects[name] = obj
+        if old is not None:
+            for field in old.__slots__:
+                setattr(obj, field, getattr(old, field))
+
+    def __getitem__(self, name: str) -> StatusObject:
+        return self.objects[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.objects
+
+    def get(self, name: str, default=None):
+        return self.objects.get(name, default)
+
+    def paths(self) -> StatusPaths:
+        # Every field received so far, what a full render can draw
+        return {
+            (name, field)
+            for name, obj in self.objects.items()
+            for field in obj.__slots__
+            if getattr(obj, field) is not None
+        }
+
+    def update(self, delta: dict) -> StatusPaths:
+        changed: StatusPaths = set()
+        objects = self.objects
+        for name, fields in delta.items():
+            obj = objects.get(name)
+            if obj is None or not obj._apply(fields, changed):
+                # Not part of the generated layout, grow it to fit
+                known = () if obj is None else obj.__slots__
+                self.__build(name, [*known, *fields])
+                objects[name]._apply(fields, changed)
+        return changed
@@ -0,0 +1,208 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import time
+
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Tuple
+
+from klipmi.model.config import ThumbnailConfig
+from klipmi.model.printer import Printer
+from klipmi.utils import encodeThumbnail, metrics
+
+# File list changes that leave a new or different gcode behind
+WARM_ACTIONS = ["create_file", "modify_file", "move_file"]
+GCODE_EXTENSIONS = [".gcode", ".g", ".gco"]
+# Seconds between checks for the end of a print while warming is paused
+WARM_IDLE_DELAY = 30
+THUMBNAIL_HELP = "Time spent on each stage of getting a thumbnail on screen"
+
+
+class ThumbnailCache:
+    """
+    Encoded thumbnails keyed by gcode file, modification time, target size
+    and background color. A small in-memory LRU sits in front of an on-disk
+    store that is trimmed back to a byte budget, least recently used first.
+    """
+
+    def __init__(self, options: ThumbnailConfig):
+        self.path: str = options.cache_dir
+        self.budget: int = options.cache_size
+        self.memoryEntries: int = options.memory_entries
+        self.memory: OrderedDict[str, str] = OrderedDict()
+
+        try:
+            os.makedirs(self.path, exist_ok=True)
+        except Exception as e:
+            logging.exception(e)
+
+    @staticmethod
+    def key(filename: str, modified: float, size: int, bgColor: str) -> str:
+        raw = "%s\0%r\0%d\0%s" % (filename, modified, size, bgColor.lower())
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def get(self, key: str) -> str | None:
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+
+        data = await asyncio.to_thread(self.__read, key)
+        if data is not None:
+            self.__remember(key, data)
+        return data
+
+    async def put(self, key: str, data: str):
+        self.__remember(key, data)
+        await asyncio.to_thread(self.__write, key, data)
+
+    def __remember(self, key: str, data: str):
+        self.memory[key] = data
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memoryEntries:
+            self.memory.popitem(last=False)
+
+    def __read(self, key: str) -> str | None:
+        path = os.path.join(self.path, key)
+        try:
+            with open(path, "r", encoding="ascii") as f:
+                data = f.read()
+            # Bump the mtime so eviction sees this entry as recently used
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.exception(e)
+            return None
+
+    def __write(self, key: str, data: str):
+        path = os.path.join(self.path, key)
+        try:
+            with open(path + ".tmp", "w", encoding="ascii") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+            self.__evict()
+        except Exception as e:
+            logging.exception(e)
+
+    def __evict(self):
+        entries = [e for e in os.scandir(self.path) if e.is_file()]
+        total = sum(e.stat().st_size for e in entries)
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            if total <= self.budget:
+                break
+            total -= entry.stat().st_size
+            os.remove(entry.path)
+
+
+class Thumbnails:
+    def __init__(
+        self,
+        options: ThumbnailConfig,
+        printer: Printer,
+        sizes: List[Tuple[int, str]],
+    ):
+        self.printer: Printer = printer
+        self.sizes: List[Tuple[int, str]] = sizes
+        self.cache: ThumbnailCache = ThumbnailCache(options)
+        self.executor: Executor
+        if options.executor == "thread":
+            self.executor = ThreadPoolExecutor(options.workers)
+        else:
+            # Spawn rather than fork a process running an event loop. Each
+            # worker still re-imports src/main.py as __mp_main__, and the
+            # app's modules with it, once when it starts
+            self.executor = ProcessPoolExecutor(
+                options.workers, multiprocessing.get_context("spawn")
+            )
+
+        self.warmEnabled: bool = options.warm
+        self.warmWorkers: int = options.warm_workers
+        self.warmQueue: asyncio.Queue[Tuple[str, float | None]] = asyncio.Queue()
+        self.warmTasks: List[asyncio.Task] = []
+
+    async def get(
+        self, filename: str, size: int, bgColor: str, modified: float | None = None
+    ) -> str:
+        if modified is None:
+            metadata = await self.printer.getMetadata(filename)
+            modified = metadata.get("modified")
+
+        key = None
+        if modified is not None:
+            key = self.cache.key(filename, modified, size, bgColor)
+            thumbnail = await self.cache.get(key)
+            metrics.counter(
+                "klipmi_thumbnail_cache_total",
+                "Thumbnail cache lookups",
+                result="miss" if thumbnail is None else "hit",
+            ).inc()
+            if thumbnail is not None:
+                return thumbnail
+
+        start = time.monotonic()
+        data = await self.printer.getThumbnail(size, filename)
+        fetched = time.monotonic()
+        thumbnail = await asyncio.get_running_loop().run_in_executor(
+            self.executor, encodeThumbnail, data, size, size, bgColor
+        )
+        metrics.histogram(
+            "klipmi_thumbnail_seconds", THUMBNAIL_HELP, stage="fetch"
+        ).observe(fetched - start)
+        metrics.histogram(
+            "klipmi_thumbnail_seconds", THUMBNAIL_HELP, stage="encode"
+        ).observe(time.monotonic() - fetched)
+        if key is not None:
+            await self.cache.put(key, thumbnail)
+        return thumbnail
+
+    def warm(self, data: dict):
+        item = data.get("item", {})
+        path = item.get("path", "")
+        if (
+            not self.warmEnabled
+            or data.get("action") not in WARM_ACTIONS
+            or item.get("root") != "gcodes"
+            or os.path.splitext(path)[1].lower() not in GCODE_EXTENSIONS
+        ):
+            return
+
+        if not self.warmTasks:
+            for _ in range(self.warmWorkers):
+                self.warmTasks.append(asyncio.create_task(self.__warmer()))
+        self.warmQueue.put_nowait((path, item.get("modified")))
+
+    async def __warmer(self):
+        while True:
+            filename, modified = await self.warmQueue.get()
+            try:
+                for size, bgColor in self.sizes:
+                    # Leave the CPU to the print, the thumbnail can wait
+                    while self.printer.isPrinting():
+                        await asyncio.sleep(WARM_IDLE_DELAY)
+                    await self.get(filename, size, bgColor, modified)
+            except Exception as e:
+                logging.warning("Failed to pre-encode %s: %s" % (filename, e))
+            finally:
+                self.warmQueue.task_done()
@@ -17,16 +17,25 @@ klipmi. If not, see <https://www.gnu.org/licenses/>.
 """
 
 import asyncio
+import time
 from abc import ABC, abstractmethod
 from collections.abc import Callable
-from typing import Dict, List, Type
+from typing import Coroutine, Dict, List, Tuple, Type
 
 from nextion import EventType
 from nextion.client import logging
 
+from klipmi.model.display import Priority
 from klipmi.model.state import KlipmiState
-from klipmi.utils import classproperty
-from klipmi.utils.libcolpic import parseThumbnail
+from klipmi.model.status import PrinterStatus
+from klipmi.model.thumbnails import THUMBNAIL_HELP
+from klipmi.utils import (
+    RenderScheduler,
+    StatusPaths,
+    classproperty,
+    mergeObjects,
+    metrics,
+)
 
 
 class BasePage(ABC):
@@ -40,49 +49,86 @@ class BasePage(ABC):
     def id(cls) -> int:
         pass
 
+    @classproperty
+    def printerObjects(cls) -> Dict[str, List[str]]:
+        # Printer objects and fields this page shows, on top of the UI's own
+        return {}
+
     def __init__(self, state: KlipmiState, changePageCallback: Callable):
         self.state = state
         self.changePageCallback = changePageCallback
+        self.tasks: Dict[str, asyncio.Task] = {}
 
     async def init(self):
         pass
 
+    def onEnter(self):
+        # Pages are kept for the life of the UI, these run every time the
+        # page is navigated to and away from
+        pass
+
+    def onLeave(self):
+        pass
+
     async def onDisplayEvent(self, type: EventType, data):
         pass
 
-    async def onPrinterStatusUpdate(self, data: dict):
+    async def onPrinterStatusUpdate(
+        self, data: PrinterStatus, changed: StatusPaths | None
+    ):
+        # Full renders pass every field received so far as changed, fields
+        # not received yet are None and their objects are left out
         pass
 
     async def onFileListUpdate(self, data: dict):
+        # Sent to every page created so far, shown or not
         pass
 
+    @staticmethod
+    def hasChanged(changed: StatusPaths | None, name: str, *fields: str) -> bool:
+        if changed is None:
+            return True
+        if len(fields) == 0:
+            return any(path[0] == name for path in changed)
+        return any((name, field) in changed for field in fields)
+
     def changePage(self, page):
         self.changePageCallback(page)
 
-    async def uploadThumbnail(
-        self, element: str, size: int, bgColor: str, filename: str
-    ):
-        thumbnail = parseThumbnail(
-            await self.state.printer.getThumbnail(size, filename),
-            size,
-            size,
-            bgColor,
-        )
-        await self.state.display.command("p[%d].%s.close()" % (self.id, element))
-
-        parts = []
-        start = 0
-        end = 1024
-        while start + 1024 < len(thumbnail):
-            parts.append(thumbnail[start:end])
-            start = start + 1024
-            end = end + 1024
-
-        parts.append(thumbnail[start : len(thumbnail)])
-        for part in parts:
-            await self.state.display.command(
-                'p[%d].%s.write("%s")' % (self.id, element, str(part))
+    def runTask(self, name: str, coro: Coroutine):
+        # Only the newest task of each name is kept running
+        self.cancelTask(name)
+        self.tasks[name] = asyncio.create_task(coro)
+
+    def cancelTask(self, name: str):
+        task = self.tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+    def cancelTasks(self):
+        for name in list(self.tasks):
+            self.cancelTask(name)
+
+    async def uploadThumbnail(self, element: str, thumbnail: str):
+        with self.state.display.priority(Priority.BULK):
+            await self.state.display.command("p[%d].%s.close()" % (self.id, element))
+
+            size = self.state.display.chunkSize
+            start = time.monotonic()
+            await self.state.display.pipeline(
+                [
+                    'p[%d].%s.write("%s")' % (self.id, element, thumbnail[i : i + size])
+                    for i in range(0, len(thumbnail), size)
+                ]
             )
+        elapsed = time.monotonic() - start
+        metrics.histogram(
+            "klipmi_thumbnail_seconds", THUMBNAIL_HELP, stage="upload"
+        ).observe(elapsed)
+        logging.debug(
+            "Uploaded %d chars to %s in %.2fs (%.0f chars/s)"
+            % (len(thumbnail), element, elapsed, len(thumbnail) / max(elapsed, 1e-6))
+        )
 
 
 class BaseUi(ABC):
@@ -93,8 +139,39 @@ class BaseUi(ABC):
     def printerObjects(cls) -> Dict[str, List[str]]:
         pass
 
+    @classproperty
+    def thumbnails(cls) -> List[Tuple[int, str]]:
+        # (size, background color) of every thumbnail the pages display
+        return []
+
+    @classproperty
+    def pages(cls) -> List[Type[BasePage]]:
+        # Every page the UI can show, their printer objects shape the status
+        return []
+
+    @classproperty
+    def statusObjects(cls) -> Dict[str, List[str]]:
+        return mergeObjects(cls.printerObjects, *(p.printerObjects for p in cls.pages))
+
     def __init__(self, state: KlipmiState):
         self.state = state
+        self.status: PrinterStatus | None = None
+        self.changed: StatusPaths | None = None
+        self.renderer = RenderScheduler(self.__render, state.options.klipmi.max_fps)
+        self.transition: asyncio.Task | None = None
+        self.pagePool: Dict[Type[BasePage], BasePage] = {}
+        # Arrival of the oldest status update not rendered yet, and how many
+        # updates are waiting
+        self.notified: float | None = None
+        self.pendingUpdates: int = 0
+        self.pendingGauge = metrics.gauge(
+            "klipmi_render_queue_depth", "Status updates waiting for a render"
+        )
+        metrics.onCollect(lambda: self.pendingGauge.set(self.pendingUpdates))
+
+    @property
+    def transitioning(self) -> bool:
+        return self.transition is not None and not self.transition.done()
 
     @abstractmethod
     def onNotReady(self):
@@ -119,24 +196,92 @@ class BaseUi(ABC):
     async def onDisplayEvent(self, type: EventType, data):
         logging.info("onDisplayEvent: EventType: %s, data: %s" % (type.name, str(data)))
         if self.currentPage is not None:
-            await self.currentPage.onDisplayEvent(type, data)
+            with self.state.display.priority(Priority.INTERACTIVE):
+                await self.currentPage.onDisplayEvent(type, data)
 
-    async def onPrinterStatusUpdate(self, data: dict):
-        if self.currentPage is not None:
-            await self.currentPage.onPrinterStatusUpdate(data)
+    async def onPrinterStatusUpdate(
+        self, data: PrinterStatus, changed: StatusPaths | None
+    ):
+        # Only the newest status is rendered, stale frames are skipped but
+        # what they changed is carried over to the next render. None asks
+        # for a full render.
+        self.status = data
+        if changed is None:
+            self.changed = None
+        elif self.changed is not None:
+            self.changed |= changed
+        if self.notified is None:
+            self.notified = time.monotonic()
+        self.pendingUpdates += 1
+        self.renderer.schedule()
+
+    async def __render(self):
+        # The page change renders everything once the page is up
+        if self.transitioning:
+            return
+
+        changed, self.changed = self.changed, set()
+        notified, self.notified = self.notified, None
+        self.pendingUpdates = 0
+        page = self.currentPage
+        if page is not None and self.status is not None:
+            if changed is None:
+                changed = self.status.paths()
+            await page.onPrinterStatusUpdate(self.status, changed)
+            if notified is not None:
+                metrics.histogram(
+                    "klipmi_render_latency_seconds",
+                    "Time from a status notification until its render is written",
+                    page=page.name,
+                ).observe(time.monotonic() - notified)
 
     async def onFileListUpdate(self, data: dict):
-        if self.currentPage is not None:
-            await self.currentPage.onFileListUpdate(data)
+        for page in list(self.pagePool.values()):
+            await page.onFileListUpdate(data)
 
-    async def __executePageChange(self):
-        if self.currentPage is not None:
+    async def __executePageChange(self, page: BasePage, start: float):
+        with self.state.display.priority(Priority.INTERACTIVE):
             await self.state.display.wakeup()
             await self.state.display.command(
-                "page %d" % self.currentPage.id, self.state.options.timeout
+                "page %d" % page.id, self.state.options.timeout
             )
-            await self.currentPage.init()
+            self.state.display.resetShadow()
+            await page.init()
+
+            # Draw whatever of the status we already have instead of waiting
+            # for the page's subscribe, and collect what changes meanwhile
+            status = self.state.printer.status
+            self.changed = set()
+            try:
+                await page.onPrinterStatusUpdate(status, status.paths())
+            except Exception as e:
+                logging.exception(e)
+
+        logging.debug(
+            "Page %s drawn %.0fms after the change"
+            % (page.name, (time.monotonic() - start) * 1000)
+        )
+        if self.changed is None or len(self.changed) > 0:
+            self.renderer.schedule()
 
     def changePage(self, page: Type[BasePage]):
-        self.currentPage = page(self.state, self.changePage)
-        asyncio.create_task(self.__executePageChange())
+        start = time.monotonic()
+        if self.transition is not None:
+            self.transition.cancel()
+        # A render of the old page may still be waiting for the display, it
+        # must not land on the new one
+        self.renderer.cancel()
+        if self.currentPage is not None:
+            self.currentPage.cancelTasks()
+            self.currentPage.onLeave()
+        if page not in self.pagePool:
+            self.pagePool[page] = page(self.state, self.changePage)
+        self.currentPage = self.pagePool[page]
+        self.currentPage.onEnter()
+        self.changed = None
+        self.state.printer.subscribe(
+            mergeObjects(self.printerObjects, page.printerObjects)
+        )
+        self.transition = asyncio.create_task(
+            self.__executePageChange(self.currentPage, start)
+        )
@@ -16,8 +16,8 @@ You should have received a copy of the GNU General Public License along with
 klipmi. If not, see <https://www.gnu.org/licenses/>. 
 """
 
-from typing import Dict, List
-from klipmi.model.ui import BaseUi
+from typing import Dict, List, Tuple, Type
+from klipmi.model.ui import BasePage, BaseUi
 from klipmi.utils.utils import classproperty
 from .pages import *
 
@@ -26,15 +26,8 @@ class OpenQ1UI(BaseUi):
     @classproperty
     def printerObjects(cls) -> Dict[str, List[str]]:
         return {
-            "gcode_move": ["extrude_factor", "speed_factor", "homing_origin"],
-            "motion_report": ["live_position", "live_velocity"],
             "fan": ["speed"],
-            "heater_bed": ["temperature", "target"],
-            "extruder": ["target", "temperature"],
-            "heater_generic chamber": ["temperature", "target"],
             "display_status": ["progress"],
-            "output_pin caselight": ["value"],
-            "output_pin sound": ["value"],
             "print_stats": [
                 "state",
                 "print_duration",
@@ -44,6 +37,24 @@ class OpenQ1UI(BaseUi):
             ],
         }
 
+    @classproperty
+    def pages(cls) -> List[Type[BasePage]]:
+        return [
+            BootPage,
+            MainPage,
+            MovePage,
+            FilelistPage,
+            SettingsPage,
+            LanguagePage,
+            FilamentPage,
+            CalibrationPage,
+            ResetPage,
+        ]
+
+    @classproperty
+    def thumbnails(cls) -> List[Tuple[int, str]]:
+        return [(MainPage.thumbnailSize, MainPage.thumbnailColor)]
+
     def onNotReady(self):
         self.changePage(BootPage)
 
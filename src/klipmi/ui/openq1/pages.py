@@ -16,11 +16,15 @@ You should have received a copy of the GNU General Public License along with
 klipmi. If not, see <https://www.gnu.org/licenses/>. 
 """
 
+from typing import Dict, List, Tuple
+
 from PIL.Image import init
 from nextion import EventType
 
+from klipmi.model.display import DisplayBatch
+from klipmi.model.status import PrinterStatus, StatusObject
 from klipmi.model.ui import BasePage
-from klipmi.utils import classproperty
+from klipmi.utils import StatusPaths, classproperty
 
 
 class OpenQ1Page(BasePage):
@@ -57,24 +61,49 @@ class MainPage(OpenQ1Page):
     def id(cls) -> int:
         return 3
 
+    @classproperty
+    def printerObjects(cls) -> Dict[str, List[str]]:
+        return {
+            "extruder": ["temperature", "target"],
+            "heater_bed": ["temperature", "target"],
+            "heater_generic chamber": ["temperature", "target"],
+            "output_pin caselight": ["value"],
+            "output_pin sound": ["value"],
+        }
+
     # Element image id's
     _regular = 32
     _highlight = 33
 
     # Thumbnail
     filename = ""
+    thumbnailSize = 160
+    thumbnailColor = "4d4d4d"
+    # (filename, encoded picture) of the last thumbnail fetched
+    thumbnail: Tuple[str, str] | None = None
+    pictureLoaded = False
 
-    def isHeating(self, heaterData: dict) -> bool:
-        return heaterData["target"] > heaterData["temperature"]
+    def isHeating(self, heaterData: StatusObject) -> bool:
+        return heaterData.target > heaterData.temperature
 
-    async def setHighlight(self, element: str, highlight: bool):
-        await self.state.display.set(
-            "%s.picc" % element, self._highlight if highlight else self._regular
-        )
+    def setHighlight(self, batch: DisplayBatch, element: str, highlight: bool):
+        batch.set("%s.picc" % element, self._highlight if highlight else self._regular)
 
     async def init(self):
         await self.state.display.set("b6.picc", 31)
 
+    def onLeave(self):
+        # The display reloads cp0 empty when the page is shown again
+        self.pictureLoaded = False
+
+    async def onFileListUpdate(self, data: dict):
+        if self.thumbnail is not None and self.thumbnail[0] in [
+            data.get("item", {}).get("path"),
+            data.get("source_item", {}).get("path"),
+        ]:
+            self.thumbnail = None
+            self.pictureLoaded = False
+
     async def onDisplayEvent(self, type: EventType, data):
         if type == EventType.TOUCH:
             if data.component_id == 0:
@@ -87,30 +116,55 @@ class MainPage(OpenQ1Page):
             else:
                 self.handleNavBarButtons(data.component_id)
 
-    async def onPrinterStatusUpdate(self, data: dict):
-        await self.state.display.set("n0.val", int(data["extruder"]["temperature"]))
-        await self.setHighlight("b3", self.isHeating(data["extruder"]))
-
-        await self.state.display.set("n1.val", int(data["heater_bed"]["temperature"]))
-        await self.setHighlight("b4", self.isHeating(data["heater_bed"]))
-
-        await self.state.display.set(
-            "n2.val", int(data["heater_generic chamber"]["temperature"])
-        )
-        await self.setHighlight("b5", self.isHeating(data["heater_generic chamber"]))
-
-        await self.setHighlight("b0", data["output_pin caselight"]["value"] > 0)
-        await self.setHighlight("b1", data["output_pin sound"]["value"] > 0)
-
-        filename = data["print_stats"]["filename"]
-        await self.state.display.set("t0.txt", filename)
-        if filename == "":
-            await self.state.display.command("vis cp0,0")
-        else:
-            if filename != self.filename:
+    async def onPrinterStatusUpdate(
+        self, data: PrinterStatus, changed: StatusPaths | None
+    ):
+        async with self.state.display.batch() as batch:
+            if self.hasChanged(changed, "extruder"):
+                batch.set("n0.val", int(data["extruder"].temperature))
+                self.setHighlight(batch, "b3", self.isHeating(data["extruder"]))
+
+            if self.hasChanged(changed, "heater_bed"):
+                batch.set("n1.val", int(data["heater_bed"].temperature))
+                self.setHighlight(batch, "b4", self.isHeating(data["heater_bed"]))
+
+            if self.hasChanged(changed, "heater_generic chamber"):
+                batch.set("n2.val", int(data["heater_generic chamber"].temperature))
+                self.setHighlight(
+                    batch, "b5", self.isHeating(data["heater_generic chamber"])
+                )
+
+            if self.hasChanged(changed, "output_pin caselight", "value"):
+                self.setHighlight(batch, "b0", data["output_pin caselight"].value > 0)
+            if self.hasChanged(changed, "output_pin sound", "value"):
+                self.setHighlight(batch, "b1", data["output_pin sound"].value > 0)
+
+            if not self.hasChanged(changed, "print_stats", "filename"):
+                return
+
+            filename = data["print_stats"].filename
+            batch.set("t0.txt", filename)
+            if filename == "":
+                self.filename = ""
+                self.pictureLoaded = False
+                self.cancelTask("thumbnail")
+                batch.command("vis cp0,0")
+            elif filename != self.filename or not self.pictureLoaded:
                 self.filename = filename
-                await self.uploadThumbnail("cp0", 160, "4d4d4d", self.filename)
-                await self.state.display.command("vis cp0,1")
+                self.runTask("thumbnail", self.showThumbnail(filename))
+
+    async def showThumbnail(self, filename: str):
+        self.pictureLoaded = False
+        if self.thumbnail is None or self.thumbnail[0] != filename:
+            self.thumbnail = (
+                filename,
+                await self.state.thumbnails.get(
+                    filename, self.thumbnailSize, self.thumbnailColor
+                ),
+            )
+        await self.uploadThumbnail("cp0", self.thumbnail[1])
+        await self.state.display.command("vis cp0,1")
+        self.pictureLoaded = True
 
 
 class MovePage(OpenQ1Page):
@@ -122,6 +176,13 @@ class MovePage(OpenQ1Page):
     def id(cls) -> int:
         return 18
 
+    @classproperty
+    def printerObjects(cls) -> Dict[str, List[str]]:
+        return {
+            "gcode_move": ["extrude_factor", "speed_factor", "homing_origin"],
+            "motion_report": ["live_position", "live_velocity"],
+        }
+
     async def onDisplayEvent(self, type: EventType, data):
         if type == EventType.TOUCH:
             if data.component_id == 22:
@@ -129,16 +190,16 @@ class MovePage(OpenQ1Page):
             else:
                 self.handleNavBarButtons(data.component_id)
 
-    async def onPrinterStatusUpdate(self, data: dict):
-        await self.state.display.set(
-            "t0.txt", f'{data["motion_report"]["live_position"][0]:.1f}'
-        )
-        await self.state.display.set(
-            "t1.txt", f'{data["motion_report"]["live_position"][1]:.1f}'
-        )
-        await self.state.display.set(
-            "t2.txt", f'{data["motion_report"]["live_position"][2]:.1f}'
-        )
+    async def onPrinterStatusUpdate(
+        self, data: PrinterStatus, changed: StatusPaths | None
+    ):
+        if not self.hasChanged(changed, "motion_report", "live_position"):
+            return
+
+        async with self.state.display.batch() as batch:
+            batch.set("t0.txt", f'{data["motion_report"].live_position[0]:.1f}')
+            batch.set("t1.txt", f'{data["motion_report"].live_position[1]:.1f}')
+            batch.set("t2.txt", f'{data["motion_report"].live_position[2]:.1f}')
 
 
 class FilelistPage(OpenQ1Page):
@@ -200,17 +261,23 @@ class FilamentPage(OpenQ1Page):
     def id(cls) -> int:
         return 62
 
+    @classproperty
+    def printerObjects(cls) -> Dict[str, List[str]]:
+        return {
+            "extruder": ["temperature", "target"],
+            "heater_bed": ["temperature", "target"],
+            "heater_generic chamber": ["temperature", "target"],
+        }
+
     # Element image id's
     _regular = 176
     _highlight = 177
 
-    def isHeating(self, heaterData: dict) -> bool:
-        return heaterData["target"] > heaterData["temperature"]
+    def isHeating(self, heaterData: StatusObject) -> bool:
+        return heaterData.target > heaterData.temperature
 
-    async def setHighlight(self, element: str, highlight: bool):
-        await self.state.display.set(
-            "%s.picc" % element, self._highlight if highlight else self._regular
-        )
+    def setHighlight(self, batch: DisplayBatch, element: str, highlight: bool):
+        batch.set("%s.picc" % element, self._highlight if highlight else self._regular)
 
     async def onDisplayEvent(self, type: EventType, data):
         if type == EventType.TOUCH:
@@ -219,29 +286,33 @@ class FilamentPage(OpenQ1Page):
             else:
                 self.handleNavBarButtons(data.component_id)
 
-    async def onPrinterStatusUpdate(self, data: dict):
-        await self.state.display.set(
-            "t0.txt", str(int(data["extruder"]["temperature"]))
-        )
-        await self.state.display.set("n0.val", int(data["extruder"]["target"]))
-        await self.setHighlight("b2", self.isHeating(data["extruder"]))
-        await self.setHighlight("b0", self.isHeating(data["extruder"]))
-
-        await self.state.display.set(
-            "t1.txt", str(int(data["heater_bed"]["temperature"]))
-        )
-        await self.state.display.set("n1.val", int(data["heater_bed"]["target"]))
-        await self.setHighlight("b3", self.isHeating(data["heater_bed"]))
-        await self.setHighlight("b1", self.isHeating(data["heater_bed"]))
-
-        await self.state.display.set(
-            "t2.txt", str(int(data["heater_generic chamber"]["temperature"]))
-        )
-        await self.state.display.set(
-            "n2.val", int(data["heater_generic chamber"]["target"])
-        )
-        await self.setHighlight("b12", self.isHeating(data["heater_generic chamber"]))
-        await self.setHighlight("b13", self.isHeating(data["heater_generic chamber"]))
+    async def onPrinterStatusUpdate(
+        self, data: PrinterStatus, changed: StatusPaths | None
+    ):
+        async with self.state.display.batch() as batch:
+            if self.hasChanged(changed, "extruder"):
+                batch.set("t0.txt", str(int(data["extruder"].temperature)))
+                batch.set("n0.val", int(data["extruder"].target))
+                self.setHighlight(batch, "b2", self.isHeating(data["extruder"]))
+                self.setHighlight(batch, "b0", self.isHeating(data["extruder"]))
+
+            if self.hasChanged(changed, "heater_bed"):
+                batch.set("t1.txt", str(int(data["heater_bed"].temperature)))
+                batch.set("n1.val", int(data["heater_bed"].target))
+                self.setHighlight(batch, "b3", self.isHeating(data["heater_bed"]))
+                self.setHighlight(batch, "b1", self.isHeating(data["heater_bed"]))
+
+            if self.hasChanged(changed, "heater_generic chamber"):
+                batch.set(
+                    "t2.txt", str(int(data["heater_generic chamber"].temperature))
+                )
+                batch.set("n2.val", int(data["heater_generic chamber"].target))
+                self.setHighlight(
+                    batch, "b12", self.isHeating(data["heater_generic chamber"])
+                )
+                self.setHighlight(
+                    batch, "b13", self.isHeating(data["heater_generic chamber"])
+                )
 
 
 class CalibrationPage(OpenQ1Page):
@@ -16,11 +16,33 @@ You should have received a copy of the GNU General Public License along with
 klipmi. If not, see <https://www.gnu.org/licenses/>. 
 """
 
-from .utils import updateNestedDict, classproperty
-from .libcolpic import parseThumbnail
+from .utils import (
+    StatusPaths,
+    classproperty,
+    mergeObjects,
+    updateNestedDict,
+)
+from .histogram import LATENCY_BUCKETS, Histogram
+from .libcolpic import encodeThumbnail, parseThumbnail
+from .registry import Counter, Gauge, MetricsRegistry, metrics
+from .prioritylock import PriorityLock
+from .reconnect import ReconnectManager
+from .scheduler import RenderScheduler
 
 __all__ = [
+    "Counter",
+    "Gauge",
+    "LATENCY_BUCKETS",
+    "Histogram",
+    "MetricsRegistry",
+    "PriorityLock",
+    "ReconnectManager",
+    "RenderScheduler",
+    "StatusPaths",
     "classproperty",
+    "mergeObjects",
+    "metrics",
     "updateNestedDict",
+    "encodeThumbnail",
     "parseThumbnail",
 ]
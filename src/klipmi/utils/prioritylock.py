@@ -0,0 +1,70 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import asyncio
+import heapq
+import itertools
+
+from collections import Counter
+from typing import Counter as CounterType, List, Tuple
+
+
+class PriorityLock:
+    """
+    Lock that is handed to the waiter with the lowest priority value first,
+    and in arrival order within the same priority.
+    """
+
+    def __init__(self):
+        self.locked: bool = False
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.order = itertools.count()
+        # Number of waiters per priority
+        self.depth: CounterType[int] = Counter()
+
+    async def acquire(self, priority: int):
+        if not self.locked and len(self.waiters) == 0:
+            self.locked = True
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.order), future))
+        self.depth[priority] += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Handed over right before the cancel, pass it on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            self.depth[priority] -= 1
+
+    def release(self):
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            # Cancelled waiters are left in the heap and skipped here
+            if not future.done():
+                # Stays locked, ownership moves to the waiter
+                future.set_result(True)
+                return
+        self.locked = False
+
+    def contended(self, priority: int) -> bool:
+        # Whether anyone more urgent than priority is waiting
+        return any(count > 0 for p, count in self.depth.items() if p < priority)
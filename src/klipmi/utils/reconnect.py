@@ -0,0 +1,66 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import asyncio
+import logging
+import random
+
+from typing import Callable, Coroutine
+
+
+class ReconnectManager:
+    """
+    Retries connect with jittered exponential backoff until it reports
+    success or the manager is stopped. Only one retry loop runs at a time,
+    however often a disconnect is reported.
+    """
+
+    def __init__(
+        self, connect: Callable[[], Coroutine], minDelay: float, maxDelay: float
+    ):
+        self.connect = connect
+        self.minDelay: float = minDelay
+        self.maxDelay: float = maxDelay
+        self.task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        if not self.running:
+            self.task = asyncio.create_task(self.__run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def __run(self):
+        delay = self.minDelay
+        attempt = 1
+        while True:
+            # Spread out the clients that all lost the same server
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+            try:
+                if await self.connect():
+                    return
+            except Exception as e:
+                logging.warning("Reconnect attempt %d failed: %s" % (attempt, e))
+            delay = min(delay * 2, self.maxDelay)
+            attempt += 1
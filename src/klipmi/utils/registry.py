@@ -0,0 +1,171 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+from typing import Callable, Dict, List, Tuple
+
+from .histogram import LATENCY_BUCKETS, Histogram
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    def __init__(self):
+        self.value: float = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Gauge:
+    def __init__(self):
+        self.value: float = 0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class NullMetric:
+    """Handed out while metrics are disabled, every update is a no-op"""
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+
+NULL_METRIC = NullMetric()
+
+
+class MetricsRegistry:
+    """
+    Named metrics with labels, rendered in the Prometheus text format. Until
+    enable() is called every lookup returns NULL_METRIC and nothing is kept.
+    """
+
+    def __init__(self):
+        self.enabled: bool = False
+        # name -> (type, help)
+        self.families: Dict[str, Tuple[str, str]] = {}
+        self.metrics: Dict[str, Dict[Labels, Counter | Gauge | Histogram]] = {}
+        self.collectors: List[Callable[[], None]] = []
+
+    def enable(self):
+        self.enabled = True
+
+    def counter(self, name: str, help: str = "", **labels) -> Counter | NullMetric:
+        if not self.enabled:
+            return NULL_METRIC
+        return self.__get(name, "counter", help, labels, Counter)
+
+    def gauge(self, name: str, help: str = "", **labels) -> Gauge | NullMetric:
+        if not self.enabled:
+            return NULL_METRIC
+        return self.__get(name, "gauge", help, labels, Gauge)
+
+    def histogram(
+        self,
+        name: str,
+        help: str = "",
+        buckets: List[float] = LATENCY_BUCKETS,
+        **labels
+    ) -> Histogram | NullMetric:
+        if not self.enabled:
+            return NULL_METRIC
+        return self.__get(name, "histogram", help, labels, lambda: Histogram(buckets))
+
+    def register(self, name: str, histogram: Histogram, help: str = "", **labels):
+        # Export a histogram that is owned and updated elsewhere
+        if self.enabled:
+            self.__family(name, "histogram", help)[self.__labels(labels)] = histogram
+
+    def onCollect(self, collector: Callable[[], None]):
+        # Called before every render, e.g. to sample gauges
+        if self.enabled:
+            self.collectors.append(collector)
+
+    def __family(self, name: str, type: str, help: str) -> dict:
+        if name not in self.families:
+            self.families[name] = (type, help)
+            self.metrics[name] = {}
+        return self.metrics[name]
+
+    @staticmethod
+    def __labels(labels: dict) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def __get(self, name: str, type: str, help: str, labels: dict, factory):
+        family = self.__family(name, type, help)
+        key = self.__labels(labels)
+        if key not in family:
+            family[key] = factory()
+        return family[key]
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+
+        lines: List[str] = []
+        for name, (type, help) in self.families.items():
+            if help:
+                lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, type))
+            for labels, metric in self.metrics[name].items():
+                if isinstance(metric, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets, metric.counts):
+                        cumulative += count
+                        lines.append(
+                            "%s_bucket%s %d"
+                            % (
+                                name,
+                                formatLabels(labels + (("le", "%g" % bound),)),
+                                cumulative,
+                            )
+                        )
+                    lines.append(
+                        "%s_bucket%s %d"
+                        % (name, formatLabels(labels + (("le", "+Inf"),)), metric.count)
+                    )
+                    lines.append(
+                        "%s_sum%s %g" % (name, formatLabels(labels), metric.sum)
+                    )
+                    lines.append(
+                        "%s_count%s %d" % (name, formatLabels(labels), metric.count)
+                    )
+                else:
+                    lines.append("%s%s %g" % (name, formatLabels(labels), metric.value))
+        return "\n".join(lines) + "\n"
+
+
+def formatLabels(labels: Labels) -> str:
+    if len(labels) == 0:
+        return ""
+    escaped = [
+        '%s="%s"'
+        % (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    ]
+    return "{%s}" % ",".join(escaped)
+
+
+# Shared by the whole process, enabled from the [metrics] config
+metrics = MetricsRegistry()
@@ -0,0 +1,59 @@
+"""
+Copyright 2024 Joe Maples <joe@maples.dev>
+
+This file is part of klipmi.
+
+klipmi is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+klipmi is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+klipmi. If not, see <https://www.gnu.org/licenses/>. 
+"""
+
+import asyncio
+import logging
+import time
+
+from typing import Callable, Coroutine
+
+
+class RenderScheduler:
+    """
+    Coalesces render requests: at most one render runs at a time, requests
+    made while it runs collapse into a single follow-up render, and renders
+    start no more often than maxFps allows.
+    """
+
+    def __init__(self, render: Callable[[], Coroutine], maxFps: float):
+        self.render = render
+        self.interval: float = 1 / maxFps if maxFps > 0 else 0
+        self.dirty: bool = False
+        self.task: asyncio.Task | None = None
+
+    def schedule(self):
+        self.dirty = True
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.__run())
+
+    def cancel(self):
+        # Drops the render in flight and any pending one
+        self.dirty = False
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def __run(self):
+        while self.dirty:
+            self.dirty = False
+            start = time.monotonic()
+            try:
+                await self.render()
+            except Exception as e:
+                logging.exception(e)
+            await asyncio.sleep(max(0, self.interval - (time.monotonic() - start)))
@@ -18,6 +18,11 @@ klipmi. If not, see <https://www.gnu.org/licenses/>.
 
 import collections.abc
 
+from typing import Dict, List, Set, Tuple
+
+# (object, field) pairs of a printer status, e.g. ("extruder", "temperature")
+StatusPaths = Set[Tuple[str, str]]
+
 
 def updateNestedDict(d, u):
     for k, v in u.items():
@@ -28,6 +33,15 @@ def updateNestedDict(d, u):
     return d
 
 
+def mergeObjects(*objects: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    merged: Dict[str, List[str]] = {}
+    for obj in objects:
+        for name, fields in obj.items():
+            merged.setdefault(name, [])
+            merged[name] += [f for f in fields if f not in merged[name]]
+    return merged
+
+
 # Taken from https://stackoverflow.com/a/76301341
 class classproperty:
     def __init__(self, func):
@@ -19,14 +19,18 @@ klipmi. If not, see <https://www.gnu.org/licenses/>.
 import asyncio
 import logging
 
-from nextion import TJC, EventType
+from nextion import EventType
 from setproctitle import setproctitle
 
 from klipmi import ui
 from klipmi.model.config import Config
+from klipmi.model.display import Display
+from klipmi.model.exporter import MetricsExporter
 from klipmi.model.printer import Printer, PrinterState
 from klipmi.model.state import KlipmiState
+from klipmi.model.thumbnails import Thumbnails
 from klipmi.model.ui import BaseUi
+from klipmi.utils import metrics
 
 
 class Klipmi:
@@ -39,28 +43,37 @@ class Klipmi:
 
         self.state: KlipmiState = KlipmiState()
         self.state.options = Config()
-        self.state.display = TJC(
-            self.state.options.klipmi.device,
-            self.state.options.klipmi.baud,
-            self.onDisplayEvent,
-        )
+        # Before anything grabs its metrics, or they stay no-ops
+        if self.state.options.metrics.enabled:
+            metrics.enable()
+        self.exporter = MetricsExporter(self.state.options.metrics, metrics)
+        self.state.display = Display(self.state.options.klipmi, self.onDisplayEvent)
         self.state.display.encoding = "utf-8"
         self.ui: BaseUi = ui.implementations[self.state.options.klipmi.ui](self.state)
         self.state.printer = Printer(
             self.state.options.moonraker,
             self.onConnectionEvent,
             self.ui.onPrinterStatusUpdate,
-            self.ui.onFileListUpdate,
-            self.ui.printerObjects,
+            self.onFileListUpdate,
+            self.ui.statusObjects,
+        )
+        self.state.thumbnails = Thumbnails(
+            self.state.options.thumbnails, self.state.printer, self.ui.thumbnails
         )
 
     async def onDisplayEvent(self, type: EventType, data):
         if type == EventType.RECONNECTED:
+            # Nothing written before the reconnect can be trusted to be shown
+            self.state.display.resetShadow()
             # Force update status on reconnect
             await self.onConnectionEvent(self.state.status)
         else:
             asyncio.create_task(self.ui.onDisplayEvent(type, data))
 
+    async def onFileListUpdate(self, data: dict):
+        self.state.thumbnails.warm(data)
+        await self.ui.onFileListUpdate(data)
+
     async def onConnectionEvent(self, status: PrinterState):
         logging.info("Conenction status: %s", status)
         self.state.status = status
@@ -74,6 +87,7 @@ class Klipmi:
             self.ui.onKlipperError()
 
     async def init(self):
+        await self.exporter.start()
         await self.state.display.connect()
         await self.state.display.wakeup()
         self.ui.onNotReady()